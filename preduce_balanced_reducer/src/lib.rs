@@ -1,8 +1,10 @@
+extern crate memchr;
 extern crate preduce_ranges_reducer;
+extern crate preduce_reducer_script;
 
 use preduce_ranges_reducer::{run_ranges, RemoveRanges};
-use std::fs;
-use std::io::{self, Read};
+use preduce_reducer_script::read_seed;
+use std::io;
 use std::marker::PhantomData;
 use std::ops::Range;
 use std::path::PathBuf;
@@ -45,40 +47,42 @@ struct RemoveBalancedReducer<R: RemoveBalanced>(PhantomData<R>);
 impl<R: RemoveBalanced> RemoveRanges for RemoveBalancedReducer<R> {
     fn remove_ranges(seed: PathBuf) -> io::Result<Vec<Range<u64>>> {
         let (open, close) = R::remove_balanced();
-        let mut ranges = vec![];
-        let mut stack = vec![];
-        let mut offset = 0u64;
+        let seed = read_seed(seed)?;
+        Ok(balanced_ranges(&seed, open, close))
+    }
+}
+
+/// Find the ranges of every balanced `open`/`close` pair in `source`, both
+/// with and without the delimiters themselves.
+///
+/// This is a single pass over `source`, keeping a stack of the offsets of the
+/// `open` bytes that have not been closed yet. Unbalanced `close` bytes are
+/// ignored. Rather than looking at every byte, we use `memchr2` to jump
+/// straight to the next `open` or `close` byte.
+fn balanced_ranges(source: &[u8], open: u8, close: u8) -> Vec<Range<u64>> {
+    let mut ranges = vec![];
+    let mut stack = vec![];
 
-        const BUF_SIZE: usize = 1024 * 1024;
-        let mut buf = vec![0; BUF_SIZE];
+    let mut next = 0;
+    while let Some(i) = memchr::memchr2(open, close, &source[next..]) {
+        let offset = (next + i) as u64;
+        next += i + 1;
 
-        let mut file = fs::File::open(seed)?;
-        let mut bytes_read;
-        while {
-            bytes_read = file.read(&mut buf)?;
-            bytes_read > 0
-        } {
-            for b in &buf[0..bytes_read] {
-                if *b == open {
-                    stack.push(offset);
-                } else if *b == close {
-                    if let Some(start) = stack.pop() {
-                        debug_assert!(start < offset);
-                        ranges.push(start..offset + 1);
+        if source[offset as usize] == open {
+            stack.push(offset);
+        } else if let Some(start) = stack.pop() {
+            debug_assert!(start < offset);
+            ranges.push(start..offset + 1);
 
-                        let inner_start = start + 1;
-                        let inner_end = offset;
-                        if inner_start < inner_end {
-                            ranges.push(inner_start..inner_end);
-                        }
-                    }
-                }
-                offset += 1;
+            let inner_start = start + 1;
+            let inner_end = offset;
+            if inner_start < inner_end {
+                ranges.push(inner_start..inner_end);
             }
         }
-
-        Ok(ranges)
     }
+
+    ranges
 }
 
 /// Run a reducer script that removes text within balanced brackets/parens/etc
@@ -88,3 +92,23 @@ impl<R: RemoveBalanced> RemoveRanges for RemoveBalancedReducer<R> {
 pub fn run_balanced<R: RemoveBalanced>() -> ! {
     run_ranges::<RemoveBalancedReducer<R>>()
 }
+
+#[cfg(test)]
+mod tests {
+    use super::balanced_ranges;
+
+    #[test]
+    fn nested() {
+        assert_eq!(balanced_ranges(b"a(b(c)d)e", b'(', b')'), vec![3..6, 4..5, 1..8, 2..7]);
+    }
+
+    #[test]
+    fn empty_pair() {
+        assert_eq!(balanced_ranges(b"f()", b'(', b')'), vec![1..3]);
+    }
+
+    #[test]
+    fn unbalanced() {
+        assert_eq!(balanced_ranges(b")<x>>(<", b'<', b'>'), vec![1..4, 2..3]);
+    }
+}
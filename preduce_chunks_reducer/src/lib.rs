@@ -1,11 +1,13 @@
+extern crate memchr;
 extern crate preduce_ranges_reducer;
+extern crate preduce_reducer_script;
 extern crate serde;
 #[macro_use]
 extern crate serde_derive;
 
 use preduce_ranges_reducer::RemoveRanges;
-use std::fs;
-use std::io::{self, Read};
+use preduce_reducer_script::read_seed;
+use std::io;
 use std::ops::Range;
 use std::path::PathBuf;
 
@@ -16,26 +18,16 @@ pub struct Chunks;
 
 impl RemoveRanges for Chunks {
     fn remove_ranges(seed: PathBuf) -> io::Result<Vec<Range<u64>>> {
-        let mut seed = fs::File::open(seed)?;
+        let seed = read_seed(seed)?;
         let mut ranges = vec![];
 
-        const BUF_SIZE: usize = 1024 * 1024;
-        let mut buf: Vec<u8> = vec![0; BUF_SIZE];
-
+        // Jump from newline to newline with `memchr`, rather than looking at
+        // every byte ourselves.
         let mut start_of_line = 0;
-        let mut current_index = 0;
-        let mut bytes_read;
-        while {
-            bytes_read = seed.read(&mut buf)?;
-            bytes_read > 0
-        } {
-            for b in &buf[0..bytes_read] {
-                current_index += 1;
-                if *b == b'\n' {
-                    ranges.push(start_of_line..current_index);
-                    start_of_line = current_index;
-                }
-            }
+        while let Some(i) = memchr::memchr(b'\n', &seed[start_of_line..]) {
+            let end_of_line = start_of_line + i + 1;
+            ranges.push(start_of_line as u64..end_of_line as u64);
+            start_of_line = end_of_line;
         }
 
         Ok(ranges)
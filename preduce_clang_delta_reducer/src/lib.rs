@@ -28,6 +28,16 @@ struct ClangDeltaReducer<C: ClangDelta> {
     index: usize,
 }
 
+lazy_static! {
+    static ref CLANG_DELTA: Option<PathBuf> = get_executable(&[
+        "/usr/local/libexec/clang_delta",
+        "/usr/libexec/clang_delta",
+        "/usr/lib/x86_64-linux-gnu/clang_delta",
+        "/usr/lib/creduce/clang_delta",
+        "/usr/local/Cellar/creduce/2.7.0/libexec/clang_delta",
+    ]);
+}
+
 impl<C: ClangDelta> Reducer for ClangDeltaReducer<C> {
     type Error = io::Error;
 
@@ -39,6 +49,11 @@ impl<C: ClangDelta> Reducer for ClangDeltaReducer<C> {
     }
 
     fn next(mut self, _seed: PathBuf) -> io::Result<Option<Self>> {
+        // Without `clang_delta`, every candidate would fail to generate, so
+        // don't keep producing them.
+        if CLANG_DELTA.is_none() {
+            return Ok(None);
+        }
         self.index += 1;
         Ok(Some(self))
     }
@@ -48,24 +63,21 @@ impl<C: ClangDelta> Reducer for ClangDeltaReducer<C> {
         _old_seed: PathBuf,
         _new_seed: PathBuf,
     ) -> Result<Option<Self>, Self::Error> {
+        if CLANG_DELTA.is_none() {
+            return Ok(None);
+        }
         Ok(Some(self))
     }
 
     fn fast_forward(mut self, _seed: PathBuf, n: usize) -> io::Result<Option<Self>> {
+        if CLANG_DELTA.is_none() {
+            return Ok(None);
+        }
         self.index += n;
         Ok(Some(self))
     }
 
     fn reduce(self, seed: PathBuf, dest: PathBuf) -> io::Result<bool> {
-        lazy_static! {
-            static ref CLANG_DELTA: Option<PathBuf> = get_executable(&[
-                "/usr/local/libexec/clang_delta",
-                "/usr/libexec/clang_delta",
-                "/usr/lib/x86_64-linux-gnu/clang_delta",
-                "/usr/lib/creduce/clang_delta",
-                "/usr/local/Cellar/creduce/2.7.0/libexec/clang_delta",
-            ]);
-        }
         match *CLANG_DELTA {
             None => Ok(false),
             Some(ref clang_delta) => {
@@ -24,6 +24,16 @@ struct ClexReducer<C: Clex> {
     index: usize,
 }
 
+lazy_static! {
+    static ref CLEX: Option<PathBuf> = get_executable(&[
+        "/usr/local/libexec/clex",
+        "/usr/libexec/clex",
+        "/usr/lib/x86_64-linux-gnu/clex",
+        "/usr/lib/creduce/clex",
+        "/usr/local/Cellar/creduce/2.7.0/libexec/clex",
+    ]);
+}
+
 impl<C: Clex> Reducer for ClexReducer<C> {
     type Error = io::Error;
 
@@ -35,6 +45,11 @@ impl<C: Clex> Reducer for ClexReducer<C> {
     }
 
     fn next(mut self, _seed: PathBuf) -> io::Result<Option<Self>> {
+        // Without `clex`, every candidate would fail to generate, so don't
+        // keep producing them.
+        if CLEX.is_none() {
+            return Ok(None);
+        }
         self.index += 1;
         Ok(Some(self))
     }
@@ -44,24 +59,21 @@ impl<C: Clex> Reducer for ClexReducer<C> {
         _old_seed: PathBuf,
         _new_seed: PathBuf,
     ) -> Result<Option<Self>, Self::Error> {
+        if CLEX.is_none() {
+            return Ok(None);
+        }
         Ok(Some(self))
     }
 
     fn fast_forward(mut self, _seed: PathBuf, n: usize) -> io::Result<Option<Self>> {
+        if CLEX.is_none() {
+            return Ok(None);
+        }
         self.index += n;
         Ok(Some(self))
     }
 
     fn reduce(self, seed: PathBuf, dest: PathBuf) -> io::Result<bool> {
-        lazy_static! {
-            static ref CLEX: Option<PathBuf> = get_executable(&[
-                "/usr/local/libexec/clex",
-                "/usr/libexec/clex",
-                "/usr/lib/x86_64-linux-gnu/clex",
-                "/usr/lib/creduce/clex",
-                "/usr/local/Cellar/creduce/2.7.0/libexec/clex",
-            ]);
-        }
         match *CLEX {
             None => Ok(false),
             Some(ref clex) => {
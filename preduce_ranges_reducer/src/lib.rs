@@ -2,8 +2,11 @@ extern crate preduce_reducer_script;
 extern crate serde;
 #[macro_use]
 extern crate serde_derive;
+#[cfg(test)]
+#[macro_use]
+extern crate serde_json;
 
-use preduce_reducer_script::{run, Reducer};
+use preduce_reducer_script::{read_seed, run, Reducer};
 use std::cmp;
 use std::fs;
 use std::io::{self, Read, Seek, Write};
@@ -99,11 +102,51 @@ where
     R: RemoveRanges,
 {
     remove_ranges: PhantomData<R>,
+    #[serde(with = "starts_and_ends")]
     ranges: Vec<Range<u64>>,
     chunk_size: usize,
     index: usize,
 }
 
+/// The reducer's state, including every range, is serialized for every IPC
+/// request and response. Rather than serializing the ranges as a list of
+/// `{"start": _, "end": _}` objects, serialize them as two parallel lists of
+/// their starts and ends, which is about half the size.
+mod starts_and_ends {
+    use serde::de::Error;
+    use serde::{Deserialize, Deserializer, Serialize, Serializer};
+    use std::ops::Range;
+
+    #[derive(Deserialize, Serialize)]
+    struct StartsAndEnds {
+        starts: Vec<u64>,
+        ends: Vec<u64>,
+    }
+
+    pub fn serialize<S>(ranges: &Vec<Range<u64>>, serializer: S) -> Result<S::Ok, S::Error>
+    where
+        S: Serializer,
+    {
+        StartsAndEnds {
+            starts: ranges.iter().map(|r| r.start).collect(),
+            ends: ranges.iter().map(|r| r.end).collect(),
+        }.serialize(serializer)
+    }
+
+    pub fn deserialize<'de, D>(deserializer: D) -> Result<Vec<Range<u64>>, D::Error>
+    where
+        D: Deserializer<'de>,
+    {
+        let StartsAndEnds { starts, ends } = StartsAndEnds::deserialize(deserializer)?;
+        if starts.len() != ends.len() {
+            return Err(D::Error::custom(
+                "mismatched number of range starts and ends",
+            ));
+        }
+        Ok(starts.into_iter().zip(ends).map(|(s, e)| s..e).collect())
+    }
+}
+
 impl<R> RemoveRangesReducer<R>
 where
     R: RemoveRanges,
@@ -202,13 +245,6 @@ where
             .enumerate()
             .partition::<Vec<_>, _>(|&(i, _)| start_removed <= i && i < end_removed);
 
-        // TODO: what follows is a pretty terrible algorithm. This would be
-        // better with some sort of interval tree that could be used to find out
-        // the delta for a particular offset. Then the algorithm could be `O(n *
-        // log n)` instead of this terrible `O(n^2)` abomination. However, none
-        // of the interval trees on crates.io are quite what we need and I don't
-        // feel like writing one myself right now...
-
         let mut ranges: Vec<_> = ranges.drain(..).map(|(_, r)| r).collect();
         ranges.sort_unstable();
         if ranges.is_empty() {
@@ -243,33 +279,45 @@ where
             rs
         });
 
-        self.ranges = ranges
-            .drain(..)
-            .filter_map(|r| {
-                let mut delta_start = 0;
-                let mut delta_end = 0;
-
-                for s in &removed {
-                    // Range is past the end of the file.
-                    if r.0.start >= new_seed_len || r.0.end >= new_seed_len {
-                        return None;
-                    }
-
-                    if s.0.start >= r.0.end {
-                        break;
-                    }
+        // The merged removed ranges are sorted and disjoint, so every removed
+        // range that starts before some offset ends before it too, except for
+        // possibly the last one. Precompute how many bytes were removed before
+        // each removed range, and then finding the delta for any offset is a
+        // binary search rather than a walk over all of the removed ranges. This
+        // makes the whole update `O(n * log n)` rather than `O(n^2)`.
+        let removed_before: Vec<u64> = removed
+            .iter()
+            .scan(0, |total, s| {
+                let before = *total;
+                *total += s.0.end - s.0.start;
+                Some(before)
+            })
+            .collect();
 
-                    let s_len = s.0.end - s.0.start;
+        let delta = |offset: u64| -> u64 {
+            // The number of removed ranges that start before `offset`.
+            let n = match removed.binary_search_by(|s| s.0.start.cmp(&offset)) {
+                Ok(n) | Err(n) => n,
+            };
+            if n == 0 {
+                return 0;
+            }
 
-                    if s.0.start < r.0.start {
-                        delta_start += cmp::min(r.0.start - s.0.start, s_len);
-                    }
+            let s = &removed[n - 1];
+            removed_before[n - 1] + cmp::min(offset - s.0.start, s.0.end - s.0.start)
+        };
 
-                    if s.0.start < r.0.end {
-                        delta_end += cmp::min(r.0.end - s.0.start, s_len);
-                    }
+        self.ranges = ranges
+            .drain(..)
+            .filter_map(|r| {
+                // Range is past the end of the file.
+                if r.0.start >= new_seed_len || r.0.end >= new_seed_len {
+                    return None;
                 }
 
+                let delta_start = delta(r.0.start);
+                let delta_end = delta(r.0.end);
+
                 let new_start = r.0.start - delta_start;
                 let new_end = r.0.end - delta_end;
                 assert!(
@@ -316,44 +364,58 @@ where
         let mut ranges: Vec<_> = self.get_ranges_in_chunk().iter().cloned().collect();
         ranges.sort_unstable_by(|a, b| OrdByStart(a.clone()).cmp(&OrdByStart(b.clone())));
 
-        let seed_len = if cfg!(debug_assertions) {
-            fs::metadata(&seed)?.len()
-        } else {
-            0
-        };
-
-        let mut seed = fs::File::open(seed)?;
-        let mut dest = fs::File::create(dest)?;
+        let contents = read_seed(&seed)?;
 
+        // When many small, scattered ranges are removed, we write many small
+        // slices of the seed in between them. Those are copied out of the
+        // cached seed contents and coalesced into large writes by the buffer.
+        // Slices of at least `BUF_SIZE` bytes instead flush the buffer and are
+        // copied from the seed file to `dest` with `io::copy`, which lets the
+        // kernel move the bytes without passing them through user space where
+        // it can (eg `copy_file_range` on Linux).
         const BUF_SIZE: usize = 1024 * 1024;
-        let mut buf: Vec<u8> = vec![0; BUF_SIZE];
+        let dest = fs::File::create(dest)?;
+        let mut dest = io::BufWriter::with_capacity(BUF_SIZE, dest);
+
+        // Copy the seed's bytes in `start..end` into `dest`.
+        let mut seed_file = None;
+        let mut copy = |dest: &mut io::BufWriter<fs::File>, start: u64, end: u64| {
+            if end - start < BUF_SIZE as u64 {
+                return dest.write_all(&contents[start as usize..end as usize]);
+            }
+
+            dest.flush()?;
+            if seed_file.is_none() {
+                seed_file = Some(fs::File::open(&seed)?);
+            }
+            let seed_file = seed_file.as_mut().unwrap();
+            seed_file.seek(io::SeekFrom::Start(start))?;
+            let copied = io::copy(&mut seed_file.take(end - start), dest.get_mut())?;
+            if copied != end - start {
+                return Err(io::Error::new(
+                    io::ErrorKind::UnexpectedEof,
+                    "seed test case was truncated",
+                ));
+            }
+            Ok(())
+        };
 
         let mut offset = 0;
         for r in ranges {
-            debug_assert!(r.start < seed_len);
-            debug_assert!(r.end <= seed_len);
+            debug_assert!(r.start < contents.len() as u64);
+            debug_assert!(r.end <= contents.len() as u64);
 
             if offset < r.start {
-                let to_write = r.start - offset;
-                let mut to_write = to_write as usize;
-
-                while to_write > BUF_SIZE {
-                    seed.read_exact(&mut buf)?;
-                    dest.write_all(&buf)?;
-                    to_write -= BUF_SIZE;
-                }
-
-                seed.read_exact(&mut buf[..to_write])?;
-                dest.write_all(&buf[..to_write])?;
+                copy(&mut dest, offset, r.start)?;
             }
 
             if offset < r.end {
-                seed.seek(io::SeekFrom::Start(r.end))?;
                 offset = r.end;
             }
         }
 
-        io::copy(&mut seed, &mut dest)?;
+        copy(&mut dest, offset, contents.len() as u64)?;
+        dest.flush()?;
         Ok(true)
     }
 }
@@ -669,4 +731,16 @@ mod tests {
             );
         }
     }
+
+    #[test]
+    fn serialize_ranges_as_starts_and_ends() {
+        let reducer = RemoveRangesReducer::<TestRanges>::new(PathBuf::from("/dev/null")).unwrap();
+
+        let json = serde_json::to_value(&reducer).unwrap();
+        assert_eq!(json["ranges"]["starts"], json!([5, 0, 7, 3]));
+        assert_eq!(json["ranges"]["ends"], json!([16, 10, 11, 5]));
+
+        let roundtripped: RemoveRangesReducer<TestRanges> = serde_json::from_value(json).unwrap();
+        assert_eq!(roundtripped, reducer);
+    }
 }
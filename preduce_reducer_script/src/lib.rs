@@ -19,7 +19,7 @@ extern crate serde_derive;
 
 use preduce_reducer_script::{Reducer, run};
 use std::fs;
-use std::io::{self, BufRead, Write};
+use std::io::{self, Write};
 use std::path::PathBuf;
 
 /// A reducer that removes single lines from seed test cases.
@@ -87,27 +87,26 @@ impl Reducer for Lines {
             return Ok(false);
         }
 
-        let seed = fs::File::open(seed)?;
-        let mut seed = io::BufReader::new(seed);
-
-        let dest = fs::File::create(dest)?;
-        let mut dest = io::BufWriter::new(dest);
-
-        let mut line = String::new();
-
-        // Copy the first `current_line - 1` lines to `dest`.
-        for _ in 0..self.current_line {
-            line.clear();
-            seed.read_line(&mut line)?;
-            dest.write_all(line.as_bytes())?;
-        }
-
-        // Read the `current_line`^th line, but don't copy it into `dest`.
-        line.clear();
-        seed.read_line(&mut line)?;
+        // `count_lines` already read the seed when this reducer was created, so
+        // this is served from memory rather than from the disk.
+        let seed = preduce_reducer_script::read_seed(seed)?;
+
+        // Find the byte offsets where the `current_line`^th line starts and
+        // ends.
+        let mut line_starts = seed.iter()
+            .enumerate()
+            .filter(|&(_, b)| *b == b'\n')
+            .map(|(i, _)| i + 1);
+        let start = match self.current_line {
+            0 => 0,
+            n => line_starts.nth(n as usize - 1).unwrap_or(seed.len()),
+        };
+        let end = line_starts.next().unwrap_or(seed.len());
 
-        // Copy the rest of the lines in `seed` into `dest`.
-        io::copy(&mut seed, &mut dest)?;
+        // Copy everything except the `current_line`^th line into `dest`.
+        let mut dest = fs::File::create(dest)?;
+        dest.write_all(&seed[..start])?;
+        dest.write_all(&seed[end..])?;
         Ok(true)
     }
 }
@@ -128,6 +127,8 @@ extern crate is_executable;
 extern crate preduce_ipc_types;
 extern crate serde;
 extern crate serde_json;
+#[cfg(test)]
+extern crate tempdir;
 
 use is_executable::IsExecutable;
 use preduce_ipc_types::{FastForwardRequest, NewRequest, NextOnInterestingRequest, NextRequest,
@@ -135,12 +136,16 @@ use preduce_ipc_types::{FastForwardRequest, NewRequest, NextOnInterestingRequest
 use preduce_ipc_types::{FastForwardResponse, NewResponse, NextOnInterestingResponse, NextResponse,
                         ReduceResponse, Response};
 use serde::{Deserialize, Serialize};
+use std::cell::RefCell;
 use std::env;
 use std::fmt;
 use std::fs;
-use std::io::{self, BufRead, Write};
+use std::io::{self, BufRead, Read, Write};
+use std::ops::Deref;
 use std::path::{Path, PathBuf};
 use std::process;
+use std::rc::Rc;
+use std::time::SystemTime;
 
 /// A trait for defining a reducer script.
 ///
@@ -308,11 +313,17 @@ pub fn run<R: Reducer>() -> ! {
 }
 
 fn try_run<R: Reducer>() -> io::Result<()> {
+    // Requests and responses carry the whole reducer state, which can be
+    // large. Use big buffers so that a message is read or written with a
+    // handful of syscalls, rather than in `stdin`'s 8KiB chunks or `stdout`'s
+    // line-buffered 1KiB chunks.
+    const BUF_SIZE: usize = 1024 * 256;
+
     let stdin = io::stdin();
-    let mut stdin = stdin.lock();
+    let mut stdin = io::BufReader::with_capacity(BUF_SIZE, stdin.lock());
 
     let stdout = io::stdout();
-    let mut stdout = stdout.lock();
+    let mut stdout = io::BufWriter::with_capacity(BUF_SIZE, stdout.lock());
 
     let mut line = String::new();
 
@@ -369,7 +380,11 @@ fn try_run<R: Reducer>() -> io::Result<()> {
         };
 
         serde_json::to_writer(&mut stdout, &response)?;
-        writeln!(&mut stdout)?
+        writeln!(&mut stdout)?;
+
+        // `preduce` waits for each response before sending its next request,
+        // so we have to flush after every response.
+        stdout.flush()?;
     }
 
     Ok(())
@@ -377,23 +392,221 @@ fn try_run<R: Reducer>() -> io::Result<()> {
 
 /// Count the number of lines in the file at the given path.
 pub fn count_lines<P: AsRef<Path>>(path: P) -> io::Result<u64> {
-    // TODO: this should really just read big buffers of bytes and then use the
-    // `bytecount` crate to count how many '\n' bytes are in there. Right now,
-    // we're paying the cost of UTF-8 decoding, which isn't necessary.
+    // Read the file through the seed cache, so that a reducer which counts
+    // lines in `new` and then generates candidates from the same seed only
+    // reads it from the disk once.
+    let contents = read_seed(path)?;
+
+    // Count the '\n' bytes directly instead of decoding lines as UTF-8. This
+    // loop has no per-line work, and gets auto-vectorized.
+    let newlines = contents.iter().filter(|&&b| b == b'\n').count() as u64;
+
+    // A final line without a trailing newline is still a line.
+    match contents.last() {
+        Some(&b) if b != b'\n' => Ok(newlines + 1),
+        _ => Ok(newlines),
+    }
+}
 
-    let mut num_lines = 0;
+/// The contents of a seed test case, as returned by `read_seed`.
+///
+/// A `Seed` derefs to the seed's bytes. Cloning a `Seed` is cheap and does not
+/// copy its contents.
+///
+/// On unix, the contents are memory mapped from the seed file rather than
+/// copied onto the heap. Every reducer script working on the same seed then
+/// shares the same pages of the OS's page cache, so memory usage does not grow
+/// with the number of reducer scripts. This relies on test cases being
+/// immutable: the seed file must not be truncated while it is mapped.
+#[derive(Clone)]
+pub struct Seed {
+    contents: Rc<SeedContents>,
+}
 
-    let file = fs::File::open(path)?;
-    let mut file = io::BufReader::new(file);
-    let mut line = String::new();
-    while {
-        line.clear();
-        file.read_line(&mut line)? > 0
-    } {
-        num_lines += 1;
+enum SeedContents {
+    Mapped(mmap::Mmap),
+    Read(Vec<u8>),
+}
+
+impl Deref for Seed {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match *self.contents {
+            SeedContents::Mapped(ref m) => m,
+            SeedContents::Read(ref v) => v,
+        }
+    }
+}
+
+impl fmt::Debug for Seed {
+    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
+        f.debug_struct("Seed").field("len", &self.len()).finish()
+    }
+}
+
+struct CachedSeed {
+    path: PathBuf,
+    len: u64,
+    modified: Option<SystemTime>,
+    contents: Seed,
+}
+
+/// Read the contents of the seed test case at the given path.
+///
+/// A reducer script is typically asked to generate many candidates from the
+/// same seed in a row, so the most recently read seed is cached in memory for
+/// the lifetime of the process, and repeated calls for the same seed do not hit
+/// the disk again. Test cases are immutable, but the cache is invalidated
+/// anyways if the file's size or modification time changes.
+pub fn read_seed<P: AsRef<Path>>(path: P) -> io::Result<Seed> {
+    thread_local! {
+        static CACHE: RefCell<Option<CachedSeed>> = RefCell::new(None);
+    }
+
+    let path = path.as_ref();
+    let metadata = fs::metadata(path)?;
+    let len = metadata.len();
+    let modified = metadata.modified().ok();
+
+    CACHE.with(|cache| {
+        let mut cache = cache.borrow_mut();
+
+        if let Some(ref cached) = *cache {
+            if cached.path == path && cached.len == len && cached.modified == modified {
+                return Ok(cached.contents.clone());
+            }
+        }
+
+        let mut file = fs::File::open(path)?;
+
+        // Empty files and things that aren't regular files (eg `/dev/null`)
+        // can't be mapped, so read those onto the heap instead.
+        let mapped = if metadata.is_file() {
+            mmap::Mmap::new(&file, len)
+        } else {
+            None
+        };
+        let contents = match mapped {
+            Some(m) => SeedContents::Mapped(m),
+            None => {
+                let mut contents = Vec::with_capacity(len as usize);
+                file.read_to_end(&mut contents)?;
+                SeedContents::Read(contents)
+            }
+        };
+        let contents = Seed {
+            contents: Rc::new(contents),
+        };
+
+        *cache = Some(CachedSeed {
+            path: path.into(),
+            len,
+            modified,
+            contents: contents.clone(),
+        });
+
+        Ok(contents)
+    })
+}
+
+#[cfg(unix)]
+mod mmap {
+    extern crate libc;
+
+    use std::fs;
+    use std::ops::Deref;
+    use std::os::unix::io::AsRawFd;
+    use std::ptr;
+    use std::slice;
+
+    /// A read-only, private memory mapping of a whole file.
+    pub struct Mmap {
+        ptr: *mut libc::c_void,
+        len: usize,
+    }
+
+    impl Mmap {
+        /// Map the first `len` bytes of the given file, or return `None` if it
+        /// can't be mapped.
+        pub fn new(file: &fs::File, len: u64) -> Option<Mmap> {
+            if len == 0 || len > usize::max_value() as u64 {
+                return None;
+            }
+            let len = len as usize;
+
+            let ptr = unsafe {
+                libc::mmap(
+                    ptr::null_mut(),
+                    len,
+                    libc::PROT_READ,
+                    libc::MAP_PRIVATE,
+                    file.as_raw_fd(),
+                    0,
+                )
+            };
+            if ptr == libc::MAP_FAILED {
+                return None;
+            }
+
+            advise_sequential(ptr, len);
+            Some(Mmap { ptr, len })
+        }
+    }
+
+    /// Reducers scan seeds from front to back, so tell the kernel to read ahead
+    /// aggressively, and to start reading the seed in now. These are only
+    /// hints, so failures are ignored.
+    #[cfg(any(target_os = "linux", target_os = "android"))]
+    fn advise_sequential(ptr: *mut libc::c_void, len: usize) {
+        unsafe {
+            libc::madvise(ptr, len, libc::MADV_SEQUENTIAL);
+            libc::madvise(ptr, len, libc::MADV_WILLNEED);
+        }
+    }
+
+    #[cfg(not(any(target_os = "linux", target_os = "android")))]
+    fn advise_sequential(_ptr: *mut libc::c_void, _len: usize) {}
+
+    impl Deref for Mmap {
+        type Target = [u8];
+
+        fn deref(&self) -> &[u8] {
+            unsafe { slice::from_raw_parts(self.ptr as *const u8, self.len) }
+        }
+    }
+
+    impl Drop for Mmap {
+        fn drop(&mut self) {
+            unsafe {
+                libc::munmap(self.ptr, self.len);
+            }
+        }
     }
+}
 
-    Ok(num_lines)
+#[cfg(not(unix))]
+mod mmap {
+    use std::fs;
+    use std::ops::Deref;
+
+    /// Memory mapping is not supported on this platform, so seeds are always
+    /// read onto the heap.
+    pub enum Mmap {}
+
+    impl Mmap {
+        pub fn new(_file: &fs::File, _len: u64) -> Option<Mmap> {
+            None
+        }
+    }
+
+    impl Deref for Mmap {
+        type Target = [u8];
+
+        fn deref(&self) -> &[u8] {
+            match *self {}
+        }
+    }
 }
 
 /// Return the first path which has an executable file located at it.
@@ -410,3 +623,56 @@ where
 
     None
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn count_lines_in_fixtures() {
+        let fixture = |name| {
+            PathBuf::from(concat!(env!("CARGO_MANIFEST_DIR"), "/../tests/fixtures")).join(name)
+        };
+        assert_eq!(count_lines(fixture("lines.txt")).unwrap(), 10);
+        assert_eq!(count_lines(fixture("lorem-ipsum.txt")).unwrap(), 44);
+        assert_eq!(count_lines("/dev/null").unwrap(), 0);
+    }
+
+    #[test]
+    fn count_lines_without_trailing_newline() {
+        let dir = tempdir::TempDir::new("count_lines_without_trailing_newline").unwrap();
+        let seed = dir.path().join("seed");
+        fs::File::create(&seed).unwrap().write_all(b"a\nb").unwrap();
+        assert_eq!(count_lines(&seed).unwrap(), 2);
+    }
+
+    #[test]
+    fn count_lines_invalid_utf8() {
+        let dir = tempdir::TempDir::new("count_lines_invalid_utf8").unwrap();
+        let seed = dir.path().join("seed");
+        fs::File::create(&seed)
+            .unwrap()
+            .write_all(b"\xff\xfe\n\xc2\n\x80")
+            .unwrap();
+        assert_eq!(count_lines(&seed).unwrap(), 3);
+    }
+
+    #[test]
+    fn read_seed_contents() {
+        let path = concat!(
+            env!("CARGO_MANIFEST_DIR"),
+            "/../tests/fixtures/lorem-ipsum.txt"
+        );
+        let mut expected = vec![];
+        fs::File::open(path)
+            .unwrap()
+            .read_to_end(&mut expected)
+            .unwrap();
+
+        let seed = read_seed(path).unwrap();
+        assert_eq!(&seed[..], &expected[..]);
+        assert_eq!(&read_seed(path).unwrap()[..], &expected[..]);
+
+        assert!(read_seed("/dev/null").unwrap().is_empty());
+    }
+}
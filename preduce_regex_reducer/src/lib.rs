@@ -1,10 +1,11 @@
 extern crate preduce_ranges_reducer;
+extern crate preduce_reducer_script;
 extern crate regex;
 
 use preduce_ranges_reducer::{RemoveRanges, run_ranges};
+use preduce_reducer_script::read_seed;
 
-use std::fs;
-use std::io::{self, Read};
+use std::io;
 use std::marker::PhantomData;
 use std::ops::Range;
 use std::path::PathBuf;
@@ -53,13 +54,7 @@ struct RemoveRegexReducer<R: RemoveRegex>(PhantomData<R>);
 
 impl<R: RemoveRegex> RemoveRanges for RemoveRegexReducer<R> {
     fn remove_ranges(seed: PathBuf) -> io::Result<Vec<Range<u64>>> {
-        let mut buf = vec![];
-
-        {
-            let mut file = fs::File::open(seed)?;
-            file.read_to_end(&mut buf)?;
-        }
-
+        let buf = read_seed(seed)?;
         let mut ranges = vec![];
 
         let regex = R::remove_regex();
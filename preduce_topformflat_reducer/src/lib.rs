@@ -11,10 +11,12 @@ extern crate tempdir;
 use preduce_chunks_reducer::Chunks;
 use preduce_ranges_reducer::RemoveRangesReducer;
 use preduce_reducer_script::{get_executable, Reducer, run};
+use std::cell::RefCell;
+use std::env;
 use std::fs;
 use std::io;
 use std::marker::PhantomData;
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
 use std::process;
 
 /// A trait for defining reducer scripts that use `topformflat`.
@@ -55,21 +57,10 @@ impl<T: Topformflat> Reducer for TopformflatReducer<T> {
         match *TOPFORMFLAT {
             None => Ok(TopformflatReducer::NotFound),
             Some(ref topformflat) => {
-                let dir = tempdir::TempDir::new("topformflat-reducer")?;
-                let flattened = dir.path().join("flattened");
-
-                {
-                    let flattened_file = fs::File::create(&flattened)?;
-                    let seed = fs::File::open(seed)?;
-                    let status = process::Command::new(topformflat)
-                        .arg(T::flatten().to_string())
-                        .stdin(seed)
-                        .stdout(flattened_file)
-                        .status()?;
-                    if !status.success() {
-                        return Ok(TopformflatReducer::NotFound);
-                    }
-                }
+                let flattened = match flatten::<T>(topformflat, &seed)? {
+                    None => return Ok(TopformflatReducer::NotFound),
+                    Some(flattened) => flattened,
+                };
 
                 Ok(TopformflatReducer::Found {
                     t: PhantomData,
@@ -128,24 +119,95 @@ impl<T: Topformflat> Reducer for TopformflatReducer<T> {
             } => (chunks, topformflat),
         };
 
-        let dir = tempdir::TempDir::new("topformflat-reducer")?;
-        let flattened = dir.path().join("flattened");
+        let flattened = match flatten::<T>(&topformflat, &seed)? {
+            None => return Err(io::Error::new(io::ErrorKind::Other, "`topformflat` failed")),
+            Some(flattened) => flattened,
+        };
 
-        {
-            let flattened_file = fs::File::create(&flattened)?;
-            let seed = fs::File::open(seed)?;
-            let status = process::Command::new(topformflat)
-                .arg(T::flatten().to_string())
-                .stdin(seed)
-                .stdout(flattened_file)
-                .status()?;
-            if !status.success() {
-                return Err(io::Error::new(io::ErrorKind::Other, "`topformflat` failed"));
+        chunks.reduce(flattened, dest)
+    }
+}
+
+struct FlattenedSeed {
+    seed: PathBuf,
+    flatten: u8,
+    // `None` if `topformflat` failed on this seed.
+    flattened: Option<PathBuf>,
+}
+
+struct FlattenCache {
+    dir: tempdir::TempDir,
+    counter: usize,
+    latest: Option<FlattenedSeed>,
+}
+
+/// Flatten the seed with `topformflat`, and return the path to the flattened
+/// file. Returns `None` if `topformflat` failed.
+///
+/// Every candidate is generated from the flattened seed, and test cases are
+/// immutable, so the most recently flattened seed is kept around on disk. This
+/// way we only spawn `topformflat` and write the flattened seed once per seed,
+/// rather than once per candidate, and because its path stays the same,
+/// `read_seed` reuses its cached contents for each candidate.
+///
+/// The flattened seeds live in a directory created within the current
+/// directory. `preduce` runs reducer scripts within a temporary directory that
+/// it cleans up, and `run` exits the process without running destructors, so
+/// anywhere else would leak the last flattened seed.
+fn flatten<T: Topformflat>(topformflat: &Path, seed: &Path) -> io::Result<Option<PathBuf>> {
+    thread_local! {
+        static CACHE: RefCell<Option<FlattenCache>> = RefCell::new(None);
+    }
+
+    CACHE.with(|cache| {
+        let mut cache = cache.borrow_mut();
+        if cache.is_none() {
+            *cache = Some(FlattenCache {
+                dir: tempdir::TempDir::new_in(env::current_dir()?, "topformflat-reducer")?,
+                counter: 0,
+                latest: None,
+            });
+        }
+        let cache = cache.as_mut().unwrap();
+
+        if let Some(ref latest) = cache.latest {
+            if latest.seed == seed && latest.flatten == T::flatten() {
+                return Ok(latest.flattened.clone());
             }
         }
 
-        chunks.reduce(flattened, dest)
-    }
+        if let Some(FlattenedSeed {
+            flattened: Some(ref old),
+            ..
+        }) = cache.latest
+        {
+            let _ = fs::remove_file(old);
+        }
+
+        // Use a new path for every seed, so that `read_seed` never mistakes one
+        // flattened seed for another.
+        cache.counter += 1;
+        let path = cache.dir.path().join(format!("flattened-{}", cache.counter));
+
+        let status = process::Command::new(topformflat)
+            .arg(T::flatten().to_string())
+            .stdin(fs::File::open(seed)?)
+            .stdout(fs::File::create(&path)?)
+            .status()?;
+        let flattened = if status.success() {
+            Some(path)
+        } else {
+            let _ = fs::remove_file(&path);
+            None
+        };
+
+        cache.latest = Some(FlattenedSeed {
+            seed: seed.into(),
+            flatten: T::flatten(),
+            flattened: flattened.clone(),
+        });
+        Ok(flattened)
+    })
 }
 
 /// Run a reducer script that uses `topformflat`.
@@ -170,3 +232,112 @@ macro_rules! topformflat_reducer {
         }
     }
 }
+
+#[cfg(all(test, unix))]
+mod tests {
+    use super::*;
+    use std::io::{Read, Write};
+    use std::os::unix::fs::PermissionsExt;
+    use tempdir::TempDir;
+
+    struct Zero;
+
+    impl Topformflat for Zero {
+        fn flatten() -> u8 {
+            0
+        }
+    }
+
+    struct One;
+
+    impl Topformflat for One {
+        fn flatten() -> u8 {
+            1
+        }
+    }
+
+    fn write_file(path: &Path, contents: &[u8]) {
+        fs::File::create(path)
+            .expect("should create file")
+            .write_all(contents)
+            .expect("should write file");
+    }
+
+    fn read_file(path: &Path) -> Vec<u8> {
+        let mut contents = vec![];
+        fs::File::open(path)
+            .expect("should open file")
+            .read_to_end(&mut contents)
+            .expect("should read file");
+        contents
+    }
+
+    /// Make a fake `topformflat` that copies its stdin to its stdout, and logs
+    /// each time it runs.
+    fn fake_topformflat(dir: &TempDir) -> (PathBuf, PathBuf) {
+        let tool = dir.path().join("topformflat");
+        let runs = dir.path().join("runs");
+        write_file(
+            &tool,
+            format!("#!/bin/sh\necho run >> '{}'\ncat\n", runs.display()).as_bytes(),
+        );
+        fs::set_permissions(&tool, fs::Permissions::from_mode(0o755))
+            .expect("should make tool executable");
+        (tool, runs)
+    }
+
+    fn num_runs(runs: &Path) -> usize {
+        read_file(runs).iter().filter(|b| **b == b'\n').count()
+    }
+
+    #[test]
+    fn flatten_caches_by_seed_and_level() {
+        let dir = TempDir::new("flatten_caches_by_seed_and_level").expect("should create temp dir");
+        let (tool, runs) = fake_topformflat(&dir);
+
+        let seed_a = dir.path().join("a");
+        write_file(&seed_a, b"a\n");
+        let seed_b = dir.path().join("b");
+        write_file(&seed_b, b"b\n");
+
+        let flattened_a = flatten::<Zero>(&tool, &seed_a)
+            .expect("should flatten")
+            .expect("should succeed");
+        assert_eq!(read_file(&flattened_a), b"a\n");
+        assert_eq!(num_runs(&runs), 1);
+
+        // The same seed reuses the same file, without running the tool again.
+        assert_eq!(
+            flatten::<Zero>(&tool, &seed_a).expect("should flatten"),
+            Some(flattened_a.clone())
+        );
+        assert_eq!(num_runs(&runs), 1);
+
+        // A new seed gets a new file, and the old one is removed.
+        let flattened_b = flatten::<Zero>(&tool, &seed_b)
+            .expect("should flatten")
+            .expect("should succeed");
+        assert!(flattened_b != flattened_a);
+        assert!(!flattened_a.exists());
+        assert_eq!(read_file(&flattened_b), b"b\n");
+        assert_eq!(num_runs(&runs), 2);
+
+        // The same seed flattened to a different level is a different key.
+        let flattened_b_one = flatten::<One>(&tool, &seed_b)
+            .expect("should flatten")
+            .expect("should succeed");
+        assert!(flattened_b_one != flattened_b);
+        assert_eq!(num_runs(&runs), 3);
+    }
+
+    #[test]
+    fn flatten_remembers_failure() {
+        let dir = TempDir::new("flatten_remembers_failure").expect("should create temp dir");
+        let seed = dir.path().join("seed");
+        write_file(&seed, b"seed\n");
+
+        let tool = Path::new("/bin/false");
+        assert_eq!(flatten::<Zero>(tool, &seed).expect("should run"), None);
+        assert_eq!(flatten::<Zero>(tool, &seed).expect("should run"), None);
+    }
+}
@@ -1,40 +1,105 @@
+extern crate preduce_chunks_reducer;
 extern crate preduce_ranges_reducer;
+extern crate preduce_reducer_script;
 extern crate serde;
 #[macro_use]
 extern crate serde_derive;
+#[cfg(test)]
+extern crate tempdir;
 
+use preduce_chunks_reducer::Chunks;
 use preduce_ranges_reducer::{run_ranges, RemoveRanges};
-use std::fs;
-use std::io::{self, BufRead};
+use preduce_reducer_script::read_seed;
+use std::io;
 use std::ops;
 use std::path::PathBuf;
+use std::str;
 
 #[derive(Debug, Deserialize, Serialize)]
 struct Blank;
 
 impl RemoveRanges for Blank {
     fn remove_ranges(seed: PathBuf) -> io::Result<Vec<ops::Range<u64>>> {
-        let seed = fs::File::open(seed)?;
-        let mut seed = io::BufReader::new(seed);
-
-        let mut ranges = vec![];
-
-        let mut offset = 0u64;
-        let mut line = String::new();
-        while {
-            line.clear();
-            seed.read_line(&mut line)? > 0
-        } {
-            if line.trim().is_empty() {
-                ranges.push(offset..offset + line.len() as u64);
-            }
-            offset += line.len() as u64;
+        // `Chunks` already splits the seed into lines; keep the blank ones.
+        let mut lines = Chunks::remove_ranges(seed.clone())?;
+        let seed = read_seed(seed)?;
+
+        // `Chunks` does not include a final line that has no trailing newline.
+        let end_of_lines = lines.last().map_or(0, |l| l.end);
+        if end_of_lines < seed.len() as u64 {
+            lines.push(end_of_lines..seed.len() as u64);
         }
 
-        Ok(ranges)
+        Ok(lines
+            .into_iter()
+            .filter(|line| is_blank(&seed[line.start as usize..line.end as usize]))
+            .collect())
     }
 }
 
+/// Is the given line empty or made only of whitespace?
+///
+/// This looks at the line's bytes directly, and only decodes the line as UTF-8
+/// if it has non-ASCII bytes, which may be Unicode whitespace.
+fn is_blank(line: &[u8]) -> bool {
+    for b in line {
+        match *b {
+            b' ' | b'\t' | b'\n' | b'\r' | b'\x0b' | b'\x0c' => continue,
+            b if b < 0x80 => return false,
+            // A line that isn't valid UTF-8 is not blank.
+            _ => {
+                return str::from_utf8(line)
+                    .map(|line| line.trim().is_empty())
+                    .unwrap_or(false)
+            }
+        }
+    }
+    true
+}
+
 fn main() {
     run_ranges::<Blank>()
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::fs;
+    use std::io::Write;
+    use tempdir::TempDir;
+
+    #[test]
+    fn is_blank_ascii() {
+        assert!(is_blank(b""));
+        assert!(is_blank(b"\n"));
+        assert!(is_blank(b" \t\r\x0b\x0c\n"));
+        assert!(!is_blank(b"  x\n"));
+    }
+
+    #[test]
+    fn is_blank_unicode_whitespace() {
+        // NO-BREAK SPACE and EM SPACE.
+        assert!(is_blank(" \u{a0}\u{2003}\n".as_bytes()));
+        assert!(!is_blank(" \u{a0}é\n".as_bytes()));
+    }
+
+    #[test]
+    fn is_blank_invalid_utf8() {
+        assert!(!is_blank(b" \xff\n"));
+        assert!(!is_blank(b"\xc2"));
+    }
+
+    #[test]
+    fn remove_ranges_unterminated_blank_last_line() {
+        let dir = TempDir::new("remove_ranges_unterminated_blank_last_line")
+            .expect("should create temp dir");
+        let seed = dir.path().join("seed");
+        fs::File::create(&seed)
+            .expect("should create seed")
+            .write_all(b"a\n\n  \nb\n\t ")
+            .expect("should write seed");
+
+        let ranges = Blank::remove_ranges(seed).expect("should find blank lines");
+        assert_eq!(ranges, vec![2..3, 3..6, 8..10]);
+    }
+}
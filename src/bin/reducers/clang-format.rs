@@ -1,14 +1,25 @@
+#[macro_use]
+extern crate lazy_static;
 extern crate preduce_reducer_script;
 extern crate serde;
 #[macro_use]
 extern crate serde_derive;
 
-use preduce_reducer_script::{run, Reducer};
+use preduce_reducer_script::{get_executable, run, Reducer};
+use std::env;
 use std::fs;
 use std::io;
 use std::path::PathBuf;
 use std::process;
 
+lazy_static! {
+    // Search the `$PATH` for `clang-format` once, rather than on every
+    // invocation.
+    static ref CLANG_FORMAT: Option<PathBuf> = env::var_os("PATH").and_then(|path| {
+        get_executable(env::split_paths(&path).map(|dir| dir.join("clang-format")))
+    });
+}
+
 #[derive(Debug, Deserialize, Serialize)]
 struct ClangFormat;
 
@@ -28,18 +39,31 @@ impl Reducer for ClangFormat {
         _old_seed: PathBuf,
         _new_seed: PathBuf,
     ) -> io::Result<Option<Self>> {
+        // Without `clang-format`, every candidate would fail to generate, so
+        // don't keep producing them.
+        if CLANG_FORMAT.is_none() {
+            return Ok(None);
+        }
         Ok(Some(self))
     }
 
     fn fast_forward(self, _seed: PathBuf, _n: usize) -> io::Result<Option<Self>> {
+        if CLANG_FORMAT.is_none() {
+            return Ok(None);
+        }
         Ok(Some(self))
     }
 
     fn reduce(self, seed: PathBuf, dest: PathBuf) -> io::Result<bool> {
+        let clang_format = match *CLANG_FORMAT {
+            None => return Ok(false),
+            Some(ref clang_format) => clang_format,
+        };
+
         let dest = fs::File::create(dest)?;
         let seed = seed.display().to_string();
 
-        let status = process::Command::new("clang-format")
+        let status = process::Command::new(clang_format)
             .args(&["-style", "{SpacesInAngles: true, IndentWidth: 0}", &seed])
             .stdout(dest)
             .stderr(process::Stdio::null())
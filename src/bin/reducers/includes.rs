@@ -1,22 +1,111 @@
+extern crate memchr;
+extern crate preduce_ranges_reducer;
+extern crate preduce_reducer_script;
+extern crate serde;
 #[macro_use]
-extern crate lazy_static;
-extern crate preduce_regex_reducer;
-extern crate regex;
+extern crate serde_derive;
 
-use preduce_regex_reducer::{run_regex, RemoveRegex};
-use regex::bytes::Regex;
+use preduce_ranges_reducer::{run_ranges, RemoveRanges};
+use preduce_reducer_script::read_seed;
+use std::io;
+use std::ops;
+use std::path::PathBuf;
 
+#[derive(Debug, Deserialize, Serialize)]
 struct Includes;
 
-impl RemoveRegex for Includes {
-    fn remove_regex() -> &'static Regex {
-        lazy_static! {
-            static ref RE: Regex = Regex::new(r#"(?m)(^\s*#\s*include.*$)"#).unwrap();
+fn is_whitespace(b: u8) -> bool {
+    match b {
+        b' ' | b'\t' | b'\n' | b'\r' | b'\x0b' | b'\x0c' => true,
+        _ => false,
+    }
+}
+
+fn skip_whitespace(source: &[u8], mut index: usize) -> usize {
+    while index < source.len() && is_whitespace(source[index]) {
+        index += 1;
+    }
+    index
+}
+
+fn end_of_line(source: &[u8], index: usize) -> usize {
+    memchr::memchr(b'\n', &source[index..]).map_or(source.len(), |i| index + i)
+}
+
+/// Find every `#include` directive, along with any blank lines preceding it,
+/// up to (but not including) the end of its line. These are the same ranges
+/// that the regex `(?m)^\s*#\s*include.*$` matches, but found with a simple
+/// scan instead.
+fn include_ranges(source: &[u8]) -> Vec<ops::Range<u64>> {
+    let mut ranges = vec![];
+
+    let mut line_start = 0;
+    while line_start < source.len() {
+        let directive = skip_whitespace(source, line_start);
+        if directive == source.len() {
+            break;
+        }
+
+        if source[directive] == b'#' {
+            let include = skip_whitespace(source, directive + 1);
+            if source[include..].starts_with(b"include") {
+                let end = end_of_line(source, include);
+                ranges.push(line_start as u64..end as u64);
+                line_start = end + 1;
+                continue;
+            }
         }
-        &*RE
+
+        // Every other line start before the next line would have skipped to
+        // the same `directive` position, so don't bother trying them.
+        line_start = end_of_line(source, directive) + 1;
+    }
+
+    ranges
+}
+
+impl RemoveRanges for Includes {
+    fn remove_ranges(seed: PathBuf) -> io::Result<Vec<ops::Range<u64>>> {
+        let seed = read_seed(seed)?;
+        Ok(include_ranges(&seed))
     }
 }
 
 fn main() {
-    run_regex::<Includes>()
+    run_ranges::<Includes>()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::include_ranges;
+
+    #[test]
+    fn blank_lines_before_directive() {
+        assert_eq!(include_ranges(b"\n\n#include <a>\nint x;\n"), vec![0..14]);
+    }
+
+    #[test]
+    fn directive_split_across_lines() {
+        assert_eq!(include_ranges(b"#\ninclude <a>\n"), vec![0..13]);
+    }
+
+    #[test]
+    fn skips_define() {
+        assert_eq!(include_ranges(b"#define X 1\n#include \"b\"\n"), vec![12..24]);
+    }
+
+    #[test]
+    fn hash_line_then_indented_include() {
+        assert_eq!(include_ranges(b"#\n  #include <c>\n"), vec![2..16]);
+    }
+
+    #[test]
+    fn no_trailing_newline() {
+        assert_eq!(include_ranges(b"int x;\n#include <d>"), vec![7..19]);
+    }
+
+    #[test]
+    fn non_utf8_tail() {
+        assert_eq!(include_ranges(b"#include <e>\n\xff\xfe#include"), vec![0..12]);
+    }
 }
@@ -163,7 +163,7 @@ impl Script {
         assert!(self.child_stdin.is_none());
         assert!(self.child_stdout.is_none());
 
-        self.out_dir = Some(Arc::new(tempdir::TempDir::new("preduce-reducer-script")?));
+        self.out_dir = Some(Arc::new(test_case::temp_dir("preduce-reducer-script")?));
 
         let mut cmd = process::Command::new(&self.program);
         cmd.current_dir(self.out_dir.as_ref().unwrap().path())
@@ -176,7 +176,7 @@ impl Script {
         self.child_stdin = Some(io::BufWriter::with_capacity(1024 * 256, stdin));
 
         let stdout = child.stdout.take().unwrap();
-        self.child_stdout = Some(io::BufReader::new(stdout));
+        self.child_stdout = Some(io::BufReader::with_capacity(1024 * 256, stdout));
 
         self.child = Some(child);
 
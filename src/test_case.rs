@@ -5,6 +5,8 @@ use blake2::{Blake2b, Digest};
 use either::{Either, Left, Right};
 use error;
 use generic_array;
+use std::env;
+use std::ffi;
 use std::fs;
 use std::hash;
 use std::io::{self, Read};
@@ -65,6 +67,40 @@ pub trait TestCaseMethods: Into<TempFile> + hash::Hash {
     fn diff_hash(&self) -> Blake2Hash;
 }
 
+/// Setting this environment variable to `1` opts in to keeping temporary test
+/// cases in the `/dev/shm` tmpfs on Linux.
+///
+/// Every candidate is written out, judged, and then usually thrown away, so
+/// keeping them in memory rather than on disk avoids a lot of disk I/O. But
+/// `/dev/shm` is often small (64MiB by default in Docker) and counts against
+/// RAM, and with many workers and a large seed it can fill up mid-run. So we
+/// only use it when asked to.
+pub const USE_SHM_ENV_VAR: &'static str = "PREDUCE_USE_SHM";
+
+/// Get the directory to create temporary directories within, given the value
+/// of the `USE_SHM_ENV_VAR` environment variable, or `None` for the default
+/// temporary directory.
+fn temp_dir_root(use_shm: Option<ffi::OsString>) -> Option<&'static path::Path> {
+    match use_shm {
+        Some(ref v) if cfg!(target_os = "linux") && v == "1" => Some(path::Path::new("/dev/shm")),
+        _ => None,
+    }
+}
+
+/// Create a new temporary directory whose name starts with the given prefix.
+///
+/// This is in the default temporary directory, unless the user opted in to
+/// using `/dev/shm` via `USE_SHM_ENV_VAR`. If `/dev/shm` can't be used, we fall
+/// back to the default temporary directory.
+pub(crate) fn temp_dir(prefix: &str) -> io::Result<tempdir::TempDir> {
+    if let Some(root) = temp_dir_root(env::var_os(USE_SHM_ENV_VAR)) {
+        if let Ok(dir) = tempdir::TempDir::new_in(root, prefix) {
+            return Ok(dir);
+        }
+    }
+    tempdir::TempDir::new(prefix)
+}
+
 #[derive(Debug, Clone)]
 struct TempFileInner {
     /// The test case file itself. Stored as an absolute path internally.
@@ -131,7 +167,7 @@ impl TempFile {
 
     /// Create a new anonymous temporary file in a new temporary directory.
     pub fn anonymous() -> error::Result<TempFile> {
-        let dir = Arc::new(tempdir::TempDir::new("preduce-anonymous")?);
+        let dir = Arc::new(temp_dir("preduce-anonymous")?);
         TempFile::new(dir, "preduce-anonymous-temp-file")
     }
 
@@ -366,7 +402,7 @@ impl Interesting {
     {
         // Create a new immutable temp file for seeding reducers with the
         // initial test case.
-        let dir = Arc::new(tempdir::TempDir::new("preduce-initial")?);
+        let dir = Arc::new(temp_dir("preduce-initial")?);
         let file_name = path::PathBuf::from(file_path.as_ref().file_name().ok_or(
             error::Error::Io(io::Error::new(
                 io::ErrorKind::Other,
@@ -675,4 +711,35 @@ mod tests {
             "And the test case should have the expected size"
         );
     }
+
+    #[test]
+    fn temp_dir_creates_a_directory() {
+        let dir = temp_dir("temp_dir_creates_a_directory").expect("should create temp dir");
+        assert!(dir.path().is_dir());
+
+        let path = dir.path().to_path_buf();
+        drop(dir);
+        assert!(!path.exists(), "Dropping the temp dir should remove it");
+    }
+
+    #[test]
+    fn temp_dir_root_defaults_to_tmp() {
+        assert_eq!(temp_dir_root(None), None);
+        assert_eq!(temp_dir_root(Some("0".into())), None);
+        assert_eq!(temp_dir_root(Some("".into())), None);
+
+        if env::var_os(USE_SHM_ENV_VAR).is_none() {
+            let dir = temp_dir("temp_dir_root_defaults_to_tmp").expect("should create temp dir");
+            assert!(dir.path().starts_with(env::temp_dir()));
+        }
+    }
+
+    #[cfg(target_os = "linux")]
+    #[test]
+    fn temp_dir_root_opt_in_to_shm() {
+        assert_eq!(
+            temp_dir_root(Some("1".into())),
+            Some(path::Path::new("/dev/shm"))
+        );
+    }
 }